@@ -0,0 +1,2496 @@
+#!/usr/bin/env python3
+"""
+PYTHON MASTER WORKER (v9 - Ultimate Production Release)
+Features:
+- Auto-dependency install (Rclone)
+- Smart Disk Splitting (Never runs out of space)
+- Max zip size cap (20GB default - triggers split before exceeding)
+- Robust Cleanup (Force deletes locked folders)
+- S3 Progress Tracking (Saves progress JSON to S3 after every completed part)
+- Crash Resume (Reads progress from S3 on startup, skips completed work)
+- Large File Direct Transfer (files > threshold copied directly source -> destination)
+
+ALL V1-V6 BUGS FIXED (50 bugs):
+- Environment variables for credentials (no hardcoding)
+- Null-safe lock handling
+- Proper exception handling (no bare except)
+- Safe subprocess calls (no shell injection)
+- Safe S3 key encoding
+- Configurable paths (not hardcoded to Colab)
+- Division by zero protection
+- Proper error messages
+- boto3 exception handling (all functions)
+- Race condition fix (per-folder progress files)
+- S3 operation timeouts
+- Signal handling for graceful shutdown
+- S3 retry logic with exponential backoff
+- Type safety with proper imports
+- Safe dictionary access with validation
+- Proper ThreadPoolExecutor shutdown
+- Pre-zip disk space verification
+- Progress file pruning for performance
+- File descriptor leak prevention
+- Structured logging for production
+- Maximum retry duration cap
+- Atomic folder complete checks
+- Partial download detection
+- Unicode filename handling
+- S3 rate limiting detection
+- Zip integrity verification
+- Backpressure mechanism
+- Instance locking (cross-platform)
+- Connection pooling
+- Timeout error handling
+
+V7 NEW FIXES (8 additional bugs):
+- Bug #51: Cross-platform instance lock (Windows/Unix)
+- Bug #52: Removed unused hashlib import
+- Bug #53: Instance lock cleanup on abnormal exit
+- Bug #54: Explicit constants to avoid 32-bit overflow
+- Bug #55: Stale lock detection and cleanup at startup
+- Bug #57: Immediate multipart upload cleanup on failure
+- Bug #58: Bounded completed_keys with MAX_COMPLETED_KEYS
+
+V8 NEW FIXES (2 additional bugs):
+- Bug #59: Added missing math import (was causing NameError)
+- Bug #60: Fixed multiprocessing.Manager() cleanup (was causing resource leak)
+
+V9 PERFORMANCE:
+- S3 client reused per process instead of rebuilt on every call
+- multiprocessing.Queue/Lock instead of Manager proxies for status and progress
+- Tuned multipart upload (50 MiB parts, 16-way concurrency) for zip parts
+- Zip output streamed straight into S3 multipart parts (no local zip staging)
+- Download size tracked from rclone --stats instead of walking the temp dir
+- Progress reads use ETag-conditional GETs against an in-memory cache
+- Progress writes debounced (flushed per part, at folder end, or every 120s / 50 updates)
+- Progress lists held as ordered dicts in memory (O(1) membership and updates)
+- Compact progress JSON (no indentation) to shrink every progress PUT/GET
+- botocore adaptive retries for S3 requests; jittered backoff for part re-uploads
+- orjson for progress/list JSON when installed (stdlib json fallback)
+- Zip parts built in-process with zipfile (ZIP_STORED); zip CLI/apt no longer needed
+- Temp dirs / staged zips deleted in the background after an O(1) rename
+- Completed-file filtering done once in main(); workers no longer re-filter each batch
+- Downloaded file list and byte count gathered in a single scandir walk per split
+- Zip members copied in 1 MiB blocks instead of zipfile's 8 KiB default
+- One worker pool, status queue and progress lock reused across all folders
+- Queued progress updates journaled locally (NDJSON) and replayed after a crash
+- Downloaded-file inventory taken from rclone's "Copied" log records, not a dir walk
+- Large files copied LARGE_FILE_CONCURRENCY at a time instead of sequentially
+- Large-file status driven by rclone's stats records instead of a 5s poll
+- Download batches of FAST_LIST_MIN_FILES+ use --fast-list on ListR-capable remotes
+- Part temp dirs from mkdtemp, optionally on a faster FAST_TMPDIR scratch filesystem
+"""
+
+import subprocess
+import sys
+import time
+import os
+import shutil
+import stat
+import random
+import re
+import io
+import json
+import unicodedata
+import uuid
+import contextlib
+import functools
+import signal
+import logging
+import atexit
+import itertools
+import collections
+import bisect
+import concurrent.futures
+import multiprocessing
+import threading
+import selectors
+from multiprocessing.util import Finalize
+import tempfile
+import zipfile
+import urllib.request
+from queue import Empty
+from urllib.parse import quote, urlparse
+from typing import Optional, Set, AbstractSet, List, Dict, Any, Tuple
+from datetime import datetime
+
+# V7 FIX: Cross-platform fcntl support
+if sys.platform != 'win32':
+    import fcntl
+else:
+    fcntl = None  # Windows doesn't have fcntl
+
+# V9: orjson (optional) for progress/list JSON - falls back to stdlib json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Check boto3 early
+try:
+    import boto3
+    import botocore.exceptions
+    from botocore.config import Config
+    from boto3.s3.transfer import TransferConfig
+    from botocore.exceptions import RequestTimeout, ConnectionError as BotocoreConnectionError
+except ImportError:
+    print("X boto3 not installed! Run: pip install boto3")
+    sys.exit(1)
+
+# ============ CONFIGURATION ============
+SOURCE = "onedrive:Work Files"      # rclone remote:path (source to zip from)
+DESTINATION = "gdrive:Work Files"   # rclone remote:path (destination for large files)
+S3_BUCKET = os.environ.get("S3_BUCKET", "workfiles123")
+S3_PREFIX = os.environ.get("S3_PREFIX", "work_files_zips/")
+
+# Get credentials from environment variables (SECURE - never hardcode!)
+AWS_ACCESS_KEY = os.environ.get("AWS_ACCESS_KEY_ID", "")
+AWS_SECRET_KEY = os.environ.get("AWS_SECRET_ACCESS_KEY", "")
+S3_ENDPOINT = os.environ.get("S3_ENDPOINT", "https://s3.ap-northeast-1.wasabisys.com")
+
+# Tuning
+MAX_PARALLEL_WORKERS = 2    # Number of simultaneous parts (Colab limit: 2 recommended)
+# V9: Rclone transfer tuning (env-overridable). RAM per rclone process is roughly
+# DOWNLOAD_THREADS x RCLONE_BUFFER_SIZE (32 x 16M = 512 MB per worker by default).
+DOWNLOAD_THREADS = int(os.environ.get("RCLONE_TRANSFERS", "32"))  # Rclone transfers per worker
+RCLONE_BUFFER_SIZE = os.environ.get("RCLONE_BUFFER_SIZE", "16M")
+RCLONE_MULTI_THREAD_STREAMS = int(os.environ.get("RCLONE_MULTI_THREAD_STREAMS", "4"))
+RCLONE_MULTI_THREAD_CUTOFF = os.environ.get("RCLONE_MULTI_THREAD_CUTOFF", "256M")
+SPLIT_THRESHOLD = 1000      # Files per batch
+# V9: Batches this big are listed (--fast-list) instead of looked up per file.
+# --fast-list only helps remotes with recursive listing (ListR: s3, gcs, b2, drive...);
+# elsewhere (e.g. onedrive) rclone ignores it and walks the whole folder, which is
+# slower than --no-traverse lookups. It also holds the full listing in memory.
+# RCLONE_FAST_LIST: "auto" (ask rclone for ListR support), "1" (always), "0" (never).
+FAST_LIST_MIN_FILES = 200
+RCLONE_FAST_LIST = os.environ.get("RCLONE_FAST_LIST", "auto").strip().lower()
+LARGE_FILE_CONCURRENCY = int(os.environ.get("LARGE_FILE_CONCURRENCY", "4"))  # V9: Parallel direct copies per folder
+ZIP_STREAM_UPLOAD = True    # V9: Pipe zip output straight to S3 (False = stage local zip on disk)
+DISK_LIMIT_PERCENT = 80     # Trigger split/clean cycle at 80% disk usage
+DISK_BACKPRESSURE_PERCENT = 70  # V6: Start throttling at 70% disk usage
+
+# V7 FIX: Explicit constants to avoid 32-bit overflow
+GB_IN_BYTES = 1024 * 1024 * 1024  # 1GB in bytes
+MAX_ZIP_SIZE_GB = 20        # Max zip size in GB
+MAX_ZIP_SIZE_BYTES = MAX_ZIP_SIZE_GB * GB_IN_BYTES  # V7: Explicit calculation
+
+# V9: Multipart upload tuning for zip parts (50 MiB parts, 16 concurrent PUTs)
+MB_IN_BYTES = 1024 * 1024
+S3_MULTIPART_THRESHOLD = 64 * MB_IN_BYTES
+S3_MULTIPART_CHUNKSIZE = 50 * MB_IN_BYTES
+S3_UPLOAD_CONCURRENCY = 16
+MULTIPART_ABORT_THREADS = 16  # V9: Concurrent aborts in cleanup_multipart_uploads
+S3_UPLOAD_MAX_INFLIGHT = 8  # V9: Buffered parts in flight per streamed zip (bounds memory to ~8 x chunksize)
+S3_READ_CHUNK_SIZE = MB_IN_BYTES  # V9: Read size when streaming line lists from S3
+FADVISE_MIN_BYTES = MB_IN_BYTES  # V9: Only drop page cache for files at least this big
+ZIP_COPY_BUFSIZE = MB_IN_BYTES  # V9: Read/write block when copying files into a zip (zipfile uses 8 KiB)
+VERIFY_ZIP_CRC = False      # V9: Re-read staged zips to check every CRC (debug; default is a structural check)
+VERIFY_ZIP_THREADS = 4      # V9: Parallel CRC checkers in verify_zip_integrity
+DOWNLOAD_POLL_INTERVAL = 2  # V9: Max seconds between download checks when rclone is quiet
+SIZE_WALK_MAX_INTERVAL = 5  # V9: Max seconds between fallback temp-dir size walks
+
+S3_MAX_RETRIES = 3          # Max whole-operation retries for zip part uploads
+S3_MAX_ATTEMPTS = 10        # V9: botocore adaptive-mode attempts per S3 request
+MAX_RETRY_DURATION = 300    # Maximum total retry duration in seconds (5 minutes)
+MAX_PROGRESS_FILES = 5000   # Maximum files to track in progress before pruning
+MAX_COMPLETED_KEYS = 1000   # V7 FIX: Maximum completed keys to track
+INSTANCE_LOCK_TIMEOUT = 300 # Instance lock timeout in seconds
+STATUS_MIN_INTERVAL = 0.5   # V9: Min seconds between repeated progress updates per part
+MONITOR_REDRAW_INTERVAL = 0.2  # V9: Min seconds between monitor redraws (bursts are coalesced)
+PROGRESS_FLUSH_INTERVAL = 120.0  # V9: Safety checkpoint - parts and folders flush on completion anyway
+PROGRESS_FLUSH_MAX_EVENTS = 50 # V9: Flush early once this many updates are queued
+PROGRESS_CACHE_MAX_FOLDERS = 4 # V9: Folders whose progress stays cached per process (LRU)
+
+# Paths - configurable via environment
+WORK_DIR = os.environ.get("WORK_DIR", "/content")
+# V9: Optional faster scratch root for part downloads (e.g. /dev/shm); WORK_DIR is
+# used when unset or when it has less than MAX_ZIP_SIZE_BYTES free
+FAST_TMPDIR = os.environ.get("FAST_TMPDIR", "")
+# V9: Prefix of this tool's part download dirs - the only names swept under
+# FAST_TMPDIR, which may be a shared scratch filesystem (/tmp, /dev/shm)
+TEMP_DIR_PREFIX = "zipper_temp_"
+RCLONE_CONFIG = os.environ.get("RCLONE_CONFIG", "/content/rclone.conf")
+PROGRESS_JOURNAL_PREFIX = ".zipper_journal_"  # V9: Per-process local progress journals in WORK_DIR
+
+# V6/V7: Unicode handling - ensure UTF-8 encoding for all file operations
+UTF8_ENCODING = 'utf-8'
+
+# ============ LOGGING SETUP ============
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout)
+    ]
+)
+logger = logging.getLogger(__name__)
+
+# =======================================
+
+# Process-safe lock - will be set in worker processes
+_progress_lock: Optional[Any] = None
+# V9: Status queue - installed in pool workers by _init_pipeline_worker
+_status_queue: Optional[Any] = None
+# V9: Single shutdown event shared by signal handler, monitor and workers
+_shutdown_requested = threading.Event()
+
+# V6/V7: Instance lock for preventing concurrent execution
+_instance_lock_file: Optional[Any] = None
+
+# V9: Per-process progress cache: folder -> (ETag, progress) of the last version seen,
+# least recently used first and capped at PROGRESS_CACHE_MAX_FOLDERS entries
+_progress_cache: "collections.OrderedDict[str, Tuple[str, Dict[str, Any]]]" = collections.OrderedDict()
+_progress_cache_lock = threading.Lock()
+
+# V9: Debounced progress writes - queued update funcs per folder (see flush_progress)
+_progress_pending: Dict[str, List[Any]] = {}
+_progress_pending_count = 0
+_progress_inflight = 0  # V9: Batches taken off _progress_pending whose save has not finished yet
+_progress_pending_lock = threading.RLock()
+_progress_flush_timer: Optional[threading.Timer] = None
+
+# V9: Background deletion of finished temp dirs / staged zips (see discard_path)
+_cleanup_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_cleanup_executor_pid: Optional[int] = None
+_cleanup_futures: List[concurrent.futures.Future] = []
+_cleanup_counter = itertools.count()
+
+# V9: This process's progress journal path (see _journal_path)
+_journal_file: Optional[str] = None
+_journal_file_pid: Optional[int] = None
+
+# V9: Per-process S3 client cache (see get_s3_client)
+_s3_client: Optional[Any] = None
+_s3_client_pid: Optional[int] = None
+_s3_client_lock = threading.Lock()
+
+# ============ S3 CONFIG WITH TIMEOUTS AND CONNECTION POOLING ============
+# V9: Virtual-hosted addressing on AWS itself (path-style is deprecated there);
+# other S3-compatible endpoints keep botocore's default
+_S3_ENDPOINT_HOST = urlparse(S3_ENDPOINT).hostname or ""
+S3_ADDRESSING = ({'addressing_style': 'virtual'}
+                 if _S3_ENDPOINT_HOST.endswith(".amazonaws.com") else None)
+
+S3_CONFIG = Config(
+    connect_timeout=30,
+    read_timeout=300,  # 5 minutes for large uploads
+    # V9: Adaptive mode - jittered backoff plus a client-side token bucket that
+    # slows down on SlowDown/503 instead of retrying in lockstep
+    retries={'mode': 'adaptive', 'max_attempts': S3_MAX_ATTEMPTS},
+    # V6: Connection pooling; V9: sized so parallel part uploads never wait on the pool
+    max_pool_connections=max(50, S3_UPLOAD_CONCURRENCY * MAX_PARALLEL_WORKERS),
+    # V9: HTTP/1.1 connections are already reused by the cached client's pool;
+    # TCP keepalive stops idle ones (between folders) being dropped by NAT/LBs
+    tcp_keepalive=True,
+    s3=S3_ADDRESSING
+)
+
+# V9: Shared transfer config for every zip part upload
+S3_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=S3_MULTIPART_THRESHOLD,
+    multipart_chunksize=S3_MULTIPART_CHUNKSIZE,
+    max_concurrency=S3_UPLOAD_CONCURRENCY,
+    io_chunksize=MB_IN_BYTES,
+    use_threads=True
+)
+
+# V9: Extra flags passed to every rclone transfer
+RCLONE_TUNING_ARGS = [
+    f'--buffer-size={RCLONE_BUFFER_SIZE}',
+    f'--multi-thread-streams={RCLONE_MULTI_THREAD_STREAMS}',
+    f'--multi-thread-cutoff={RCLONE_MULTI_THREAD_CUTOFF}',
+]
+
+# V9: rclone logging for the batch download - JSON records on stderr with a
+# stats record every 2s (stats are logged at NOTICE so --quiet can't be used)
+RCLONE_LOG_ARGS = [
+    '--use-json-log',
+    '--log-level=INFO',  # V9: INFO carries the per-file "Copied (...)" records
+    '--stats=2s',
+    '--stats-log-level=NOTICE',
+]
+
+# ============ S3 FOLDER INDEX ============
+FOLDER_INDEX_KEY = f"{S3_PREFIX}_index/folder_list.txt"
+
+
+# ============ INSTANCE LOCK (V7 FIX - Cross-Platform) ============
+
+def _process_exists(pid: int) -> bool:
+    """V7 FIX: Check if a process with given PID exists."""
+    try:
+        if sys.platform != 'win32':
+            os.kill(pid, 0)  # Unix: Send signal 0 to check if process exists
+        else:
+            # Windows: Use tasklist
+            import subprocess
+            result = subprocess.run(['tasklist', '/FI', f'PID eq {pid}'], 
+                                   capture_output=True, text=True)
+            return str(pid) in result.stdout
+        return True
+    except (OSError, ProcessLookupError):
+        return False
+    except Exception:
+        return False
+
+
+def _acquire_windows_lock(lock_path: str) -> bool:
+    """V7 FIX: Windows-compatible instance lock using PID file."""
+    global _instance_lock_file
+    try:
+        # Check for existing lock
+        if os.path.exists(lock_path):
+            try:
+                with open(lock_path, 'r') as f:
+                    content = f.read()
+                    for line in content.splitlines():
+                        if line.startswith("PID:"):
+                            pid = int(line.split(":")[1].strip())
+                            if not _process_exists(pid):
+                                # Stale lock - remove it
+                                os.remove(lock_path)
+                                break
+            except Exception:
+                pass
+        
+        # Create lock file
+        _instance_lock_file = open(lock_path, 'w')
+        _instance_lock_file.write(f"PID: {os.getpid()}\nStarted: {datetime.now().isoformat()}\n")
+        _instance_lock_file.flush()
+        return True
+    except Exception as e:
+        logger.warning(f"Could not acquire Windows instance lock: {e}")
+        return False
+
+
+def _acquire_unix_lock(lock_path: str) -> bool:
+    """V7 FIX: Unix instance lock using fcntl."""
+    global _instance_lock_file
+    try:
+        os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+        # V9: Open without truncating - a running instance's PID must survive a failed attempt
+        _instance_lock_file = open(lock_path, 'a+')
+        # V9: POSIX record lock (F_SETLK) - works over NFS, dropped by the kernel when
+        # the process dies (even SIGKILL), and not shared with forked pool workers
+        fcntl.lockf(_instance_lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        _instance_lock_file.seek(0)
+        _instance_lock_file.truncate()
+        _instance_lock_file.write(f"PID: {os.getpid()}\nStarted: {datetime.now().isoformat()}\n")
+        _instance_lock_file.flush()
+        return True
+    except (IOError, OSError) as e:
+        if _instance_lock_file:
+            try:
+                _instance_lock_file.close()
+            except Exception:
+                pass
+            _instance_lock_file = None
+        logger.warning(f"Could not acquire Unix instance lock: {e}")
+        return False
+
+
+def acquire_instance_lock() -> bool:
+    """
+    V7 FIX: Acquire a file lock to prevent multiple instances.
+    Cross-platform: Uses fcntl on Unix, PID file on Windows.
+    """
+    lock_path = os.path.join(WORK_DIR, ".zipper_instance.lock")
+    
+    # V7 FIX: Check for stale lock first
+    if os.path.exists(lock_path):
+        try:
+            with open(lock_path, 'r') as f:
+                content = f.read()
+                for line in content.splitlines():
+                    if line.startswith("PID:"):
+                        pid = int(line.split(":")[1].strip())
+                        if not _process_exists(pid):
+                            # Stale lock - remove it
+                            os.remove(lock_path)
+                            logger.info(f"Removed stale lock from crashed instance (PID: {pid})")
+                            break
+        except Exception as e:
+            logger.warning(f"Error checking for stale lock: {e}")
+    
+    # Platform-specific lock acquisition
+    if fcntl is not None:
+        return _acquire_unix_lock(lock_path)
+    else:
+        return _acquire_windows_lock(lock_path)
+
+
+def release_instance_lock() -> None:
+    """V7 FIX: Release the instance lock."""
+    global _instance_lock_file
+    if _instance_lock_file:
+        try:
+            if fcntl is not None:
+                fcntl.lockf(_instance_lock_file.fileno(), fcntl.LOCK_UN)
+            _instance_lock_file.close()
+            lock_path = os.path.join(WORK_DIR, ".zipper_instance.lock")
+            try:
+                os.unlink(lock_path)
+            except FileNotFoundError:
+                pass
+        except Exception as e:
+            logger.warning(f"Error releasing instance lock: {e}")
+        _instance_lock_file = None
+
+
+# V7 FIX: Register cleanup handlers for abnormal exit
+def _cleanup_on_exit():
+    """V7 FIX: Cleanup handler called on normal exit."""
+    flush_all_progress()  # V9: Don't lose debounced progress updates
+    release_instance_lock()
+
+atexit.register(_cleanup_on_exit)
+
+
+# ============ UNICODE HANDLING (V6 FIX) ============
+
+def safe_encode_filename(filename: str) -> str:
+    """V6 FIX: Safely encode filenames to handle Unicode characters."""
+    # V9: isascii() is an allocation-free scan; no throwaway bytes or exception
+    if filename.isascii():
+        return filename
+    return unicodedata.normalize('NFC', filename)
+
+
+# ============ S3 PROGRESS TRACKING ============
+
+def json_loads_bytes(data: bytes) -> Any:
+    """V9: Parse a UTF-8 JSON body (orjson when available)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data.decode(UTF8_ENCODING))
+
+
+def json_dumps_bytes(obj: Any) -> bytes:
+    """V9: Compact UTF-8 JSON (orjson when available)."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode(UTF8_ENCODING)
+
+
+# V9: ClientError codes meaning "object does not exist" (GET reports NoSuchKey, HEAD a bare 404)
+_MISSING_KEY_CODES = ('NoSuchKey', '404', 'NotFound')
+
+
+def get_progress_key(folder_name: str) -> str:
+    """Get per-folder progress file key."""
+    safe_name = sanitize_name(folder_name)
+    return f"{S3_PREFIX}_progress/{safe_name}_progress.json"
+
+
+# V9: Map space and slash to '_' before quoting - same result as replacing %20/%2F after
+_SANITIZE_TABLE = str.maketrans({' ': '_', '/': '_'})
+
+
+@functools.lru_cache(maxsize=4096)
+def sanitize_name(name: str) -> str:
+    """Sanitize name for S3 key while preserving Unicode (V9: memoized - folder names repeat)."""
+    safe_name = safe_encode_filename(name)
+    return quote(safe_name.translate(_SANITIZE_TABLE), safe='')
+
+
+def get_s3_client() -> Any:
+    """
+    Return the process-wide S3 client, creating it on first use.
+    
+    V9: Client construction (credential resolution, endpoint setup, TLS pool)
+    is paid once per process instead of once per call. The cache is keyed on
+    the PID so forked pool workers build their own client rather than sharing
+    the parent's connection pool.
+    """
+    global _s3_client, _s3_client_pid
+    if not AWS_ACCESS_KEY or not AWS_SECRET_KEY:
+        raise ValueError(
+            "AWS credentials not configured!\n"
+            "Set environment variables:\n"
+            "  export AWS_ACCESS_KEY_ID='your_access_key'\n"
+            "  export AWS_SECRET_ACCESS_KEY='your_secret_key'"
+        )
+    pid = os.getpid()
+    if _s3_client is not None and _s3_client_pid == pid:
+        return _s3_client
+    with _s3_client_lock:
+        if _s3_client is None or _s3_client_pid != pid:
+            _s3_client = boto3.client(
+                service_name='s3',
+                aws_access_key_id=AWS_ACCESS_KEY,
+                aws_secret_access_key=AWS_SECRET_KEY,
+                endpoint_url=S3_ENDPOINT,
+                config=S3_CONFIG
+            )
+            _s3_client_pid = pid
+    return _s3_client
+
+
+def s3_operation_with_retry(operation_func: Any, max_retries: int = S3_MAX_RETRIES,
+                            max_duration: int = MAX_RETRY_DURATION) -> Any:
+    """
+    Execute S3 operation with retry logic.
+    V9: Only wraps operations botocore cannot retry itself (a zip part upload
+    restarts from the source); backoff uses full jitter so workers don't retry in lockstep.
+    """
+    start_time = time.time()
+    last_exception: Optional[Exception] = None
+    
+    for attempt in range(max_retries):
+        if time.time() - start_time > max_duration:
+            logger.error(f"Retry duration exceeded {max_duration}s")
+            raise TimeoutError(f"Retry duration exceeded {max_duration} seconds")
+        
+        try:
+            return operation_func()
+        except botocore.exceptions.ConnectionError as e:
+            last_exception = e
+            if attempt < max_retries - 1:
+                wait_time = random.uniform(0, 2 ** attempt)
+                logger.warning(f"S3 connection error, retrying in {wait_time:.1f}s...")
+                time.sleep(wait_time)
+        except botocore.exceptions.ClientError as e:
+            error_code = e.response.get('Error', {}).get('Code', '')
+            
+            # V6 FIX: Handle S3 rate limiting
+            if error_code in ('SlowDown', '503', 'RequestLimitExceeded'):
+                last_exception = e
+                wait_time = random.uniform(0, min(2 ** (attempt + 2), 60))
+                logger.warning(f"S3 rate limited, backing off for {wait_time:.1f}s...")
+                time.sleep(wait_time)
+                continue
+            
+            if error_code in ('NoSuchKey', 'AccessDenied', 'InvalidAccessKeyId'):
+                raise
+            last_exception = e
+            if attempt < max_retries - 1:
+                wait_time = random.uniform(0, 2 ** attempt)
+                logger.warning(f"S3 client error, retrying in {wait_time:.1f}s...")
+                time.sleep(wait_time)
+        except (RequestTimeout, BotocoreConnectionError) as e:
+            last_exception = e
+            if attempt < max_retries - 1:
+                wait_time = random.uniform(0, 2 ** attempt)
+                logger.warning(f"S3 timeout/connection error, retrying in {wait_time:.1f}s...")
+                time.sleep(wait_time)
+        except Exception as e:
+            last_exception = e
+            if attempt < max_retries - 1:
+                wait_time = random.uniform(0, 2 ** attempt)
+                logger.warning(f"S3 error, retrying in {wait_time:.1f}s...")
+                time.sleep(wait_time)
+    
+    raise last_exception if last_exception else Exception("Unknown S3 error")
+
+
+# V9: List fields held in memory as insertion-ordered dicts (O(1) membership/add,
+# oldest-first order kept for pruning); still plain JSON lists on S3
+_PROGRESS_SET_FIELDS = ("completed_keys", "completed_files", "large_files_done")
+
+
+def _progress_from_json(progress: Dict[str, Any]) -> Dict[str, Any]:
+    """V9: Convert the JSON list fields of a loaded progress file to ordered dicts."""
+    for field in _PROGRESS_SET_FIELDS:
+        if field in progress:
+            progress[field] = dict.fromkeys(progress[field])
+    return progress
+
+
+def _progress_to_json(progress: Dict[str, Any]) -> Dict[str, Any]:
+    """V9: Inverse of _progress_from_json - a JSON-ready copy with list fields."""
+    data = dict(progress)
+    for field in _PROGRESS_SET_FIELDS:
+        if field in data:
+            data[field] = list(data[field])
+    return data
+
+
+def _ensure_progress_fields(progress: Dict[str, Any]) -> None:
+    """V9: Make sure all tracked collections exist before an update."""
+    for field in _PROGRESS_SET_FIELDS:
+        if field not in progress:
+            progress[field] = {}
+
+
+# V7 FIX: Enhanced progress pruning with completed_keys bound
+def prune_progress_files(progress: Dict[str, Any], max_files: int = MAX_PROGRESS_FILES) -> Dict[str, Any]:
+    """Prune completed_files and completed_keys if they grow too large (oldest entries go first)."""
+    # Prune completed_files
+    completed_files = progress.get("completed_files", {})
+    if len(completed_files) > max_files:
+        progress["completed_files"] = dict.fromkeys(
+            itertools.islice(completed_files, len(completed_files) - max_files, None))
+        logger.info(f"Pruned completed_files to {max_files} entries")
+    
+    # V7 FIX: Also prune completed_keys
+    completed_keys = progress.get("completed_keys", {})
+    if len(completed_keys) > MAX_COMPLETED_KEYS:
+        progress["completed_keys"] = dict.fromkeys(
+            itertools.islice(completed_keys, len(completed_keys) - MAX_COMPLETED_KEYS, None))
+        logger.info(f"Pruned completed_keys to {MAX_COMPLETED_KEYS} entries")
+    
+    return progress
+
+
+def fetch_folder_list() -> List[str]:
+    """Fetch the folder list from S3."""
+    def _fetch() -> List[str]:
+        s3 = get_s3_client()
+        response = s3.get_object(Bucket=S3_BUCKET, Key=FOLDER_INDEX_KEY)
+        # V9: Decode line by line - the whole body is never held as bytes + str + list
+        lines = (raw.decode(UTF8_ENCODING).strip()
+                 for raw in response['Body'].iter_lines(chunk_size=S3_READ_CHUNK_SIZE))
+        return [line for line in lines if line]
+    
+    try:
+        folders = _fetch()  # V9: botocore's adaptive retries cover this request
+        logger.info(f"Found {len(folders)} folders from S3 index")
+        return folders
+    except botocore.exceptions.ClientError as e:
+        error_code = e.response.get('Error', {}).get('Code', '')
+        if error_code in _MISSING_KEY_CODES:
+            logger.error("Folder index not found on S3")
+        else:
+            logger.error(f"Could not fetch folder index from S3: {e}")
+        logger.info("Run mapper.py first to create the folder index.")
+        return []
+    except Exception as e:
+        logger.error(f"Unexpected error fetching folder index: {e}")
+        return []
+
+
+def _cache_get(folder_name: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """V9: Cached (ETag, progress) for a folder, marking it most recently used."""
+    with _progress_cache_lock:
+        cached = _progress_cache.get(folder_name)
+        if cached is not None:
+            _progress_cache.move_to_end(folder_name)
+        return cached
+
+
+def _cache_put(folder_name: str, etag: str, progress: Dict[str, Any]) -> None:
+    """V9: Cache a folder's progress, evicting the least recently used folders."""
+    with _progress_cache_lock:
+        _progress_cache[folder_name] = (etag, progress)
+        _progress_cache.move_to_end(folder_name)
+        while len(_progress_cache) > PROGRESS_CACHE_MAX_FOLDERS:
+            _progress_cache.popitem(last=False)
+
+
+def _cache_drop(folder_name: str) -> None:
+    """V9: Forget a folder's cached progress."""
+    with _progress_cache_lock:
+        _progress_cache.pop(folder_name, None)
+
+
+def load_progress(folder_name: str, cache: bool = True) -> Dict[str, Any]:
+    """
+    Load progress JSON from S3 for a specific folder.
+    V9: cache=False for one-off reads (e.g. a folder_complete check) that should
+    not take a slot in the per-process cache.
+    """
+    progress_key = get_progress_key(folder_name)
+    
+    def _load() -> Dict[str, Any]:
+        s3 = get_s3_client()
+        # V9: Conditional GET - an unchanged object costs a 304, not a download + parse
+        cached = _cache_get(folder_name)
+        conditional = {'IfNoneMatch': cached[0]} if cached else {}
+        try:
+            response = s3.get_object(Bucket=S3_BUCKET, Key=progress_key, **conditional)
+        except botocore.exceptions.ClientError as e:
+            if cached and e.response.get('Error', {}).get('Code', '') in ('304', 'NotModified'):
+                return cached[1]
+            raise
+        progress = _progress_from_json(json_loads_bytes(response['Body'].read()))
+        etag = response.get('ETag')
+        if etag and cache:
+            _cache_put(folder_name, etag, progress)
+        return progress
+    
+    try:
+        return _load()  # V9: botocore's adaptive retries cover this request
+    except botocore.exceptions.ClientError as e:
+        error_code = e.response.get('Error', {}).get('Code', '')
+        if error_code in _MISSING_KEY_CODES:
+            return {}
+        logger.warning(f"Error loading progress from S3: {e}")
+        return {}
+    except json.JSONDecodeError as e:
+        logger.warning(f"Progress file corrupted, starting fresh: {e}")
+        return {}
+    except Exception as e:
+        logger.warning(f"Error loading progress from S3: {e}")
+        return {}
+
+
+def save_progress(folder_name: str, progress: Dict[str, Any]) -> bool:
+    """Save progress JSON to S3 for a specific folder."""
+    progress_key = get_progress_key(folder_name)
+    progress = prune_progress_files(progress)  # V7 FIX: Prune before saving
+    
+    def _save() -> bool:
+        s3 = get_s3_client()
+        response = s3.put_object(
+            Bucket=S3_BUCKET,
+            Key=progress_key,
+            # V9: Compact JSON - machine-read file, indentation was pure payload
+            Body=json_dumps_bytes(_progress_to_json(progress)),
+            ContentType='application/json; charset=utf-8'
+        )
+        # V9: What we just wrote is the current version - cache it under the new ETag
+        etag = response.get('ETag')
+        if etag:
+            _cache_put(folder_name, etag, progress)
+        else:
+            _cache_drop(folder_name)
+        return True
+    
+    try:
+        return _save()  # V9: botocore's adaptive retries cover this request
+    except botocore.exceptions.ClientError as e:
+        # The dict may have been mutated in place - don't serve it as current
+        _cache_drop(folder_name)
+        logger.error(f"Failed to save progress to S3: {e}")
+        return False
+    except Exception as e:
+        _cache_drop(folder_name)
+        logger.error(f"Unexpected error saving progress: {e}")
+        return False
+
+
+def _update_progress_safe(folder_name: str, update_func: Any) -> bool:
+    """Safely update progress with lock handling."""
+    global _progress_lock
+    
+    def _do_update() -> bool:
+        progress = load_progress(folder_name)
+        update_func(progress)
+        return save_progress(folder_name, progress)
+    
+    if _progress_lock is not None:
+        with _progress_lock:
+            return _do_update()
+    else:
+        return _do_update()
+
+
+def _schedule_progress_flush() -> None:
+    """V9: Arm the flush timer if updates are pending and none is armed."""
+    global _progress_flush_timer
+    with _progress_pending_lock:
+        if _progress_pending and _progress_flush_timer is None:
+            _progress_flush_timer = threading.Timer(PROGRESS_FLUSH_INTERVAL, flush_all_progress)
+            _progress_flush_timer.daemon = True
+            _progress_flush_timer.start()
+
+
+def _journal_path() -> str:
+    """
+    V9: Local progress journal of the calling process. The name carries a random
+    token besides the PID, so a journal kept after a failed replay can never be
+    mistaken for (and deleted as) the journal of a later process reusing the PID.
+    """
+    global _journal_file, _journal_file_pid
+    pid = os.getpid()
+    if _journal_file is None or _journal_file_pid != pid:
+        _journal_file = os.path.join(WORK_DIR, f"{PROGRESS_JOURNAL_PREFIX}{pid}_{uuid.uuid4().hex}.ndjson")
+        _journal_file_pid = pid
+    return _journal_file
+
+
+def _journal_append(record: Dict[str, Any]) -> None:
+    """
+    V9: Append one progress record to this process's local NDJSON journal, so
+    updates still waiting for the debounced flush survive a crash. Best effort:
+    a journal failure only loses that durability, never the update itself.
+    """
+    try:
+        fd = os.open(_journal_path(), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, json_dumps_bytes(record) + b"\n")
+        finally:
+            os.close(fd)
+    except Exception as e:
+        logger.warning(f"Could not journal progress record: {e}")
+
+
+def _apply_progress_record(progress: Dict[str, Any], record: Dict[str, Any]) -> None:
+    """V9: Apply one journaled progress record (idempotent)."""
+    _ensure_progress_fields(progress)
+    if record["op"] == "part":
+        # V9: O(1) per entry - no list scan, no list->set->list rebuild
+        progress["completed_keys"][record["key"]] = None
+        progress["completed_files"].update(dict.fromkeys(record["files"]))
+    elif record["op"] == "large":
+        progress["large_files_done"][record["path"]] = None
+
+
+def _is_progress_record_applied(progress: Dict[str, Any], record: Dict[str, Any]) -> bool:
+    """V9: True if the progress state already contains everything a record adds."""
+    if record["op"] == "part":
+        completed_files = progress.get("completed_files", {})
+        return (record["key"] in progress.get("completed_keys", {})
+                and all(f in completed_files for f in record["files"]))
+    if record["op"] == "large":
+        return record["path"] in progress.get("large_files_done", {})
+    return True
+
+
+def replay_progress_journals() -> int:
+    """
+    V9: Apply progress journals left behind by crashed processes (startup only,
+    before any worker runs). Folders already containing every record are not
+    rewritten. Returns the number of folders updated; a journal is deleted
+    only once all its records are saved.
+    """
+    journals: List[str] = []
+    try:
+        with os.scandir(WORK_DIR) as entries:
+            journals = [entry.path for entry in entries
+                        if entry.name.startswith(PROGRESS_JOURNAL_PREFIX) and entry.name.endswith(".ndjson")]
+    except OSError:
+        return 0
+    
+    updated = 0
+    for path in journals:
+        records_by_folder: Dict[str, List[Dict[str, Any]]] = {}
+        try:
+            with open(path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json_loads_bytes(line)
+                    except ValueError:
+                        continue  # Torn last line from a crash mid-append
+                    records_by_folder.setdefault(record["folder"], []).append(record)
+        except OSError as e:
+            logger.warning(f"Could not read progress journal {path}: {e}")
+            continue
+        
+        success = True
+        for folder, records in records_by_folder.items():
+            progress = load_progress(folder)
+            if all(_is_progress_record_applied(progress, record) for record in records):
+                continue
+            
+            def update(progress: Dict[str, Any], records: List[Dict[str, Any]] = records) -> None:
+                for record in records:
+                    _apply_progress_record(progress, record)
+            
+            if _update_progress_safe(folder, update):
+                updated += 1
+            else:
+                success = False
+        
+        if success:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+        else:
+            logger.warning(f"Progress journal {path} kept for the next run")
+    return updated
+
+
+def _queue_progress_update(folder_name: str, update_func: Any,
+                           record: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    V9: Queue a progress update for the debounced flusher instead of a synchronous
+    S3 round-trip. A record describing the update is journaled locally first.
+    """
+    global _progress_pending_count
+    with _progress_pending_lock:
+        # Journal under the same lock that flush_progress() checks before truncating
+        if record is not None:
+            _journal_append(record)
+        _progress_pending.setdefault(folder_name, []).append(update_func)
+        _progress_pending_count += 1
+        flush_now = _progress_pending_count >= PROGRESS_FLUSH_MAX_EVENTS
+    if flush_now:
+        return flush_all_progress()
+    _schedule_progress_flush()
+    return True
+
+
+def flush_progress(folder_name: Optional[str] = None) -> bool:
+    """
+    V9: Write queued progress updates - one load/replay/save per folder.
+    Updates are replayed onto freshly loaded state under the progress lock, so
+    writes made by other processes are merged, never overwritten. Folders whose
+    save fails are requeued for the next flush.
+    """
+    global _progress_pending_count, _progress_inflight, _progress_flush_timer
+    with _progress_pending_lock:
+        if folder_name is None:
+            batch = dict(_progress_pending)
+            _progress_pending.clear()
+        else:
+            funcs = _progress_pending.pop(folder_name, None)
+            batch = {folder_name: funcs} if funcs else {}
+        _progress_pending_count -= sum(len(funcs) for funcs in batch.values())
+        if batch:
+            _progress_inflight += 1
+        if folder_name is None or not _progress_pending:
+            if _progress_flush_timer is not None:
+                _progress_flush_timer.cancel()
+                _progress_flush_timer = None
+    
+    success = True
+    try:
+        for folder, funcs in batch.items():
+            def update(progress: Dict[str, Any], funcs: List[Any] = funcs) -> None:
+                for func in funcs:
+                    func(progress)
+            
+            if not _update_progress_safe(folder, update):
+                success = False
+                with _progress_pending_lock:
+                    _progress_pending[folder] = funcs + _progress_pending.get(folder, [])
+                    _progress_pending_count += len(funcs)
+    finally:
+        if batch:
+            with _progress_pending_lock:
+                _progress_inflight -= 1
+    
+    # V9: Nothing left unsaved in this process - its journal is redundant. Batches
+    # another thread is still saving count as unsaved until that save returns.
+    with _progress_pending_lock:
+        if batch and not _progress_pending and not _progress_inflight:
+            try:
+                os.unlink(_journal_path())
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not remove progress journal: {e}")
+    
+    _schedule_progress_flush()
+    return success
+
+
+def flush_all_progress() -> bool:
+    """V9: Write every queued progress update (timer callback and shutdown paths)."""
+    return flush_progress()
+
+
+def mark_part_complete(folder_name: str, s3_key: str, files_in_part: List[str]) -> bool:
+    """Mark a part as complete in progress tracking (V9: written by the debounced flusher)."""
+    record = {"op": "part", "folder": folder_name, "key": s3_key, "files": files_in_part}
+    
+    def update(progress: Dict[str, Any]) -> None:
+        _apply_progress_record(progress, record)
+    
+    return _queue_progress_update(folder_name, update, record)
+
+
+def mark_large_file_complete(folder_name: str, file_path: str) -> bool:
+    """Mark a single large file as transferred (V9: written by the debounced flusher)."""
+    record = {"op": "large", "folder": folder_name, "path": file_path}
+    
+    def update(progress: Dict[str, Any]) -> None:
+        _apply_progress_record(progress, record)
+    
+    return _queue_progress_update(folder_name, update, record)
+
+
+def mark_folder_complete(folder_name: str) -> bool:
+    """Mark folder as fully complete - written immediately together with any queued updates."""
+    def update(progress: Dict[str, Any]) -> None:
+        progress["folder_complete"] = True
+    
+    _queue_progress_update(folder_name, update)
+    return flush_progress(folder_name)
+
+
+def get_completed_large_files(folder_name: str) -> AbstractSet[str]:
+    """Get completed large files for a folder (V9: read-only keys view, no set copy)."""
+    progress = load_progress(folder_name)
+    return progress.get("large_files_done", {}).keys()
+
+
+def list_progress_keys() -> Optional[Set[str]]:
+    """
+    V9: List all existing per-folder progress keys with one paginated LIST.
+    Returns None if the listing failed (callers then fall back to per-folder GETs).
+    """
+    try:
+        s3 = get_s3_client()
+        paginator = s3.get_paginator('list_objects_v2')
+        keys: Set[str] = set()
+        for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=f"{S3_PREFIX}_progress/"):
+            keys.update(obj['Key'] for obj in page.get('Contents', []))
+        return keys
+    except Exception as e:
+        logger.warning(f"Could not list progress files: {e}")
+        return None
+
+
+# ============ UTILITY FUNCTIONS ============
+
+def get_folder_size_bytes(path: str) -> int:
+    """Calculate folder size in bytes (symlinks are not counted or followed)."""
+    # V9: Stack-based scandir walk - file type comes from readdir's d_type, so
+    # each file costs one lstat instead of os.walk's isdir + islink + getsize
+    total_size = 0
+    stack = [path]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            total_size += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return total_size
+
+
+def scan_downloaded_files(temp_dir: str, skip_name: str = "filelist.txt") -> Tuple[List[str], int]:
+    """
+    V9: Single scandir walk over a download dir - returns the non-empty files'
+    relative paths ('/'-separated, like rclone listings) and their total size,
+    so the staged-zip disk check needs no second walk.
+    """
+    rel_paths: List[str] = []
+    total_size = 0
+    stack = [(temp_dir, "")]
+    while stack:
+        dir_path, rel_prefix = stack.pop()
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append((entry.path, rel_prefix + entry.name + "/"))
+                        elif entry.is_file():
+                            if not rel_prefix and entry.name == skip_name:
+                                continue
+                            size = entry.stat().st_size
+                            if size > 0:
+                                rel_paths.append(rel_prefix + entry.name)
+                                total_size += size
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return rel_paths, total_size
+
+
+def check_disk_usage(path: str = "/") -> bool:
+    """Returns True if disk usage (of the filesystem holding path) exceeds DISK_LIMIT_PERCENT."""
+    try:
+        total, used, free = shutil.disk_usage(path)
+        if total > 0:
+            percent = (used / total) * 100
+            return percent > DISK_LIMIT_PERCENT
+    except (OSError, IOError):
+        pass
+    return False
+
+
+def get_disk_usage_percent(path: str = "/") -> float:
+    """Get current disk usage percentage (of the filesystem holding path)."""
+    try:
+        total, used, free = shutil.disk_usage(path)
+        if total > 0:
+            return (used / total) * 100
+    except (OSError, IOError):
+        pass
+    return 0.0
+
+
+def apply_backpressure(path: str = "/") -> bool:
+    """Check if backpressure should be applied (to writes under path)."""
+    usage = get_disk_usage_percent(path)
+    return usage > DISK_BACKPRESSURE_PERCENT
+
+
+def check_disk_space_for_file(required_bytes: int, path: str = None) -> bool:
+    """Check if there's enough disk space for a file."""
+    try:
+        if path is None:
+            path = WORK_DIR
+        stat_result = shutil.disk_usage(path)
+        return stat_result.free >= required_bytes * 1.1
+    except (OSError, IOError):
+        return True
+
+
+def get_download_root() -> str:
+    """V9: Directory new part downloads go under - FAST_TMPDIR if it can hold a full part."""
+    if FAST_TMPDIR:
+        try:
+            if shutil.disk_usage(FAST_TMPDIR).free >= MAX_ZIP_SIZE_BYTES:
+                return FAST_TMPDIR
+        except OSError:
+            pass
+    return WORK_DIR
+
+
+@functools.lru_cache(maxsize=None)
+def remote_supports_list_r(remote: str) -> bool:
+    """V9: True if the rclone remote can list recursively in one call (--fast-list)."""
+    if RCLONE_FAST_LIST in ("1", "true", "yes"):
+        return True
+    if RCLONE_FAST_LIST in ("0", "false", "no"):
+        return False
+    cmd = ['rclone', 'backend', 'features', remote]
+    if os.path.exists(RCLONE_CONFIG):
+        cmd.extend(['--config', RCLONE_CONFIG])
+    try:
+        result = subprocess.run(cmd, capture_output=True, timeout=60)
+        if result.returncode != 0:
+            return False
+        return bool(json_loads_bytes(result.stdout).get("Features", {}).get("ListR"))
+    except (OSError, subprocess.SubprocessError, ValueError, AttributeError) as e:
+        logger.warning(f"Could not query rclone features for {remote}: {e}")
+        return False
+
+
+def handle_remove_readonly(func: Any, path: str, exc: Any) -> None:
+    """Force delete read-only files on Windows."""
+    excvalue = exc[1]
+    if func in (os.rmdir, os.remove, os.unlink) and hasattr(excvalue, 'errno') and excvalue.errno == 13:
+        try:
+            os.chmod(path, stat.S_IWRITE)
+            func(path)
+        except (OSError, IOError):
+            raise
+    else:
+        raise
+
+
+def _remove_path(path: str) -> None:
+    """V9: Delete a file or directory tree (worker for discard_path)."""
+    try:
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path, onerror=handle_remove_readonly)
+        else:
+            os.remove(path)
+    except Exception:
+        subprocess.run(["rm", "-rf", path], capture_output=True)
+
+
+# V9: Suffix discard_path() gives paths awaiting background deletion
+_GC_SUFFIX_RE = re.compile(r'\.gc\d+_\d+$')
+
+
+def discard_path(path: str) -> None:
+    """
+    V9: Delete a finished temp dir / staged zip off the critical path. The O(1)
+    rename frees the name at once (a retried split reuses it); the actual
+    delete runs on a per-process background thread.
+    """
+    global _cleanup_executor, _cleanup_executor_pid, _cleanup_futures
+    gc_path = f"{path}.gc{os.getpid()}_{next(_cleanup_counter)}"
+    try:
+        os.rename(path, gc_path)
+    except FileNotFoundError:
+        return  # Nothing to delete
+    except OSError:
+        gc_path = path
+    if _cleanup_executor is None or _cleanup_executor_pid != os.getpid():
+        # Executors don't survive fork - each pool worker gets its own
+        _cleanup_executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        _cleanup_executor_pid = os.getpid()
+        _cleanup_futures = []
+    _cleanup_futures = [f for f in _cleanup_futures if not f.done()]
+    _cleanup_futures.append(_cleanup_executor.submit(_remove_path, gc_path))
+
+
+def wait_background_cleanup() -> None:
+    """V9: Block until this process's background deletions have finished."""
+    if _cleanup_executor_pid == os.getpid():
+        concurrent.futures.wait(_cleanup_futures)
+
+
+def drop_page_cache(path: str) -> None:
+    """V9: Tell the kernel a file's cached pages won't be read again (no-op where unsupported)."""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+
+
+def normalize_path(path: str) -> str:
+    """Normalize path separators to forward slashes."""
+    return path.replace('\\', '/')
+
+
+def filter_completed(files: List[str], completed: AbstractSet[str]) -> List[str]:
+    """
+    V9: Drop files already recorded as complete, comparing with normalized separators.
+    rclone listings only use '/', so unless a backslash actually appears the
+    per-path normalize_path() pass is skipped and `completed` is used as-is.
+    """
+    if any('\\' in f for f in files) or any('\\' in f for f in completed):
+        completed_normalized = frozenset(map(normalize_path, completed))
+        is_done = completed_normalized.__contains__
+        return [f for f in files if not is_done(normalize_path(f))]
+    return list(itertools.filterfalse(completed.__contains__, files))
+
+
+def cleanup_orphaned_temp_dirs() -> int:
+    """
+    Clean up orphaned temp directories from previous crashed runs, plus staged
+    zips that discard_path() renamed but a dead process never got to delete.
+    """
+    cleaned = 0
+    # WORK_DIR belongs to this tool (legacy temp_/unzip_ names included); under a
+    # shared FAST_TMPDIR only our own prefix is ever touched
+    roots = [(WORK_DIR, (TEMP_DIR_PREFIX, "temp_", "unzip_"))]
+    if FAST_TMPDIR and os.path.abspath(FAST_TMPDIR) != os.path.abspath(WORK_DIR):
+        roots.append((FAST_TMPDIR, (TEMP_DIR_PREFIX,)))  # V9: Downloads may also live here
+    for root, prefixes in roots:
+        try:
+            # V9: scandir - the directory check comes from d_type, no extra stat per entry
+            with os.scandir(root) as entries:
+                for entry in entries:
+                    try:
+                        if entry.name.startswith(prefixes):
+                            if entry.is_dir(follow_symlinks=False):
+                                shutil.rmtree(entry.path, onerror=handle_remove_readonly)
+                                cleaned += 1
+                        elif (root == WORK_DIR and _GC_SUFFIX_RE.search(entry.name)
+                              and entry.is_file(follow_symlinks=False)):
+                            os.unlink(entry.path)
+                            cleaned += 1
+                    except Exception:
+                        pass
+        except OSError:
+            pass
+    return cleaned
+
+
+def fetch_map(folder_name: str) -> List[str]:
+    """Downloads the normal file list from S3."""
+    safe_name = sanitize_name(folder_name)
+    map_key = f"{S3_PREFIX}{safe_name}_List.txt"
+    
+    def _fetch() -> List[str]:
+        s3 = get_s3_client()
+        response = s3.get_object(Bucket=S3_BUCKET, Key=map_key)
+        # V9: Decode line by line - the whole body is never held as bytes + str + list
+        lines = (raw.decode(UTF8_ENCODING).strip()
+                 for raw in response['Body'].iter_lines(chunk_size=S3_READ_CHUNK_SIZE))
+        return [line for line in lines if line]
+    
+    try:
+        return _fetch()  # V9: botocore's adaptive retries cover this request
+    except botocore.exceptions.ClientError as e:
+        error_code = e.response.get('Error', {}).get('Code', '')
+        if error_code in _MISSING_KEY_CODES:
+            return []
+        logger.warning(f"Error fetching file map: {e}")
+        return []
+    except Exception as e:
+        logger.warning(f"Error fetching file map: {e}")
+        return []
+
+
+def fetch_large_files(folder_name: str) -> List[Dict[str, Any]]:
+    """Downloads the large files list from S3."""
+    safe_name = sanitize_name(folder_name)
+    large_key = f"{S3_PREFIX}{safe_name}_LargeFiles.json"
+    
+    def _fetch() -> List[Dict[str, Any]]:
+        s3 = get_s3_client()
+        response = s3.get_object(Bucket=S3_BUCKET, Key=large_key)
+        return json_loads_bytes(response['Body'].read())
+    
+    try:
+        return _fetch()  # V9: botocore's adaptive retries cover this request
+    except botocore.exceptions.ClientError as e:
+        error_code = e.response.get('Error', {}).get('Code', '')
+        if error_code in _MISSING_KEY_CODES:
+            return []
+        logger.warning(f"Error fetching large files list: {e}")
+        return []
+    except json.JSONDecodeError as e:
+        logger.warning(f"Large files list corrupted: {e}")
+        return []
+    except Exception as e:
+        logger.warning(f"Error fetching large files list: {e}")
+        return []
+
+
+# V6 FIX: Zip integrity verification
+def _find_bad_zip_member(zip_path: str, members: List[Any]) -> Optional[str]:
+    """V9: CRC-check a slice of members; returns the first bad name, or None."""
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        for info in members:
+            try:
+                # ZipExtFile verifies CRC-32 when the member is read to EOF
+                with zf.open(info) as member:
+                    while member.read(MB_IN_BYTES):
+                        pass
+            except zipfile.BadZipFile:
+                return info.filename
+    return None
+
+
+def verify_zip_integrity(zip_path: str) -> bool:
+    """Verify that a zip file is valid before upload."""
+    try:
+        # V9: Opening parses the end-of-central-directory record and the central
+        # directory - enough to catch a truncated or malformed archive. The CRCs
+        # were computed by zipfile while writing, so re-reading every byte is opt-in.
+        with zipfile.ZipFile(zip_path, 'r') as zf:
+            members = zf.infolist()
+        if not VERIFY_ZIP_CRC:
+            return True
+        # V9: Same check as testzip(), split across threads (zlib.crc32 releases
+        # the GIL); each thread uses its own ZipFile handle
+        slices = [members[i::VERIFY_ZIP_THREADS] for i in range(VERIFY_ZIP_THREADS)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=VERIFY_ZIP_THREADS) as exe:
+            bad_files = [bad for bad in exe.map(_find_bad_zip_member, itertools.repeat(zip_path), slices) if bad]
+        if bad_files:
+            logger.error(f"Zip file has corrupted file: {bad_files[0]}")
+            return False
+        return True
+    except zipfile.BadZipFile as e:
+        logger.error(f"Invalid zip file: {e}")
+        return False
+    except Exception as e:
+        logger.error(f"Error verifying zip: {e}")
+        return False
+
+
+def new_rclone_log_state() -> Dict[str, Any]:
+    """V9: State filled in by pump_rclone_log for one rclone process."""
+    return {
+        "has_stats": False,
+        "bytes": 0,
+        "copied": set(),  # Destination-relative paths rclone reported as fully copied
+        "errors": collections.deque(maxlen=20),
+        "partial": b"",
+    }
+
+
+def _parse_rclone_log_line(raw: bytes, state: Dict[str, Any]) -> None:
+    """V9: Record transferred bytes from a stats record, a copied file, or keep an error message."""
+    raw = raw.strip()
+    if not raw:
+        return
+    try:
+        record = json_loads_bytes(raw)  # V9: orjson when installed - this runs once per log line
+    except ValueError:
+        # Rare path: retry with invalid UTF-8 replaced, else keep the text as an error
+        line = raw.decode(UTF8_ENCODING, errors='replace')
+        try:
+            record = json.loads(line)
+        except ValueError:
+            state["errors"].append(line)
+            return
+    if not isinstance(record, dict):
+        return
+    stats = record.get("stats")
+    if isinstance(stats, dict) and "bytes" in stats:
+        state["bytes"] = int(stats["bytes"])
+        state["has_stats"] = True
+    level = record.get("level")
+    if level == "info":
+        # "Copied (new)", "Multi-thread Copied (new)", "Copied (replaced existing)", ...
+        obj = record.get("object")
+        if isinstance(obj, str) and "Copied (" in str(record.get("msg", "")):
+            state["copied"].add(obj)
+    elif level in ("error", "critical"):
+        state["errors"].append(str(record.get("msg") or raw.decode(UTF8_ENCODING, errors='replace')))
+
+
+def pump_rclone_log(stream: Any, state: Dict[str, Any]) -> bool:
+    """
+    V9: Read whatever rclone's --use-json-log stderr has ready (call once a
+    selector reports it readable) and parse the complete lines.
+    Returns False at EOF, i.e. once rclone has exited and closed the pipe.
+    """
+    try:
+        chunk = os.read(stream.fileno(), 65536)
+    except OSError:
+        chunk = b""
+    if not chunk:
+        if state["partial"]:
+            _parse_rclone_log_line(state["partial"], state)
+            state["partial"] = b""
+        return False
+    *lines, state["partial"] = (state["partial"] + chunk).split(b"\n")
+    for raw in lines:
+        _parse_rclone_log_line(raw, state)
+    return True
+
+
+def write_zip_stored(source_dir: str, members: List[str], fileobj: Any) -> int:
+    """
+    V9: In-process stored (no compression) zip of the given files, each named by
+    its '/'-separated path relative to source_dir. Only the listed members are
+    archived - rclone leftovers such as *.partial files never are, so the zip
+    matches the inventory recorded in progress. fileobj may be unseekable
+    (entries then carry data descriptors). Returns the number of files written.
+    """
+    count = 0
+    with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_STORED, allowZip64=True,
+                         strict_timestamps=False) as zf:
+        for arcname in members:
+            path = os.path.join(source_dir, *arcname.split('/'))
+            # V9: Same as zf.write() but with a 1 MiB copy block - one
+            # read/CRC/write round per MiB instead of per 8 KiB
+            zinfo = zipfile.ZipInfo.from_file(path, arcname, strict_timestamps=False)
+            zinfo.compress_type = zipfile.ZIP_STORED
+            with open(path, 'rb') as src, zf.open(zinfo, 'w') as dest:
+                shutil.copyfileobj(src, dest, ZIP_COPY_BUFSIZE)
+            count += 1
+            # V9: Each source file is read exactly once - release its pages now
+            # rather than when the temp dir is finally deleted
+            if zinfo.file_size >= FADVISE_MIN_BYTES:
+                drop_page_cache(path)
+    return count
+
+
+class _MultipartUploadWriter(io.RawIOBase):
+    """
+    V9: Write-only stream that cuts whatever is written into S3 multipart
+    upload parts of S3_MULTIPART_CHUNKSIZE, uploading up to
+    S3_UPLOAD_MAX_INFLIGHT parts concurrently while the writer keeps going.
+    Call complete() when done writing, or abort() on failure.
+    """
+    
+    def __init__(self, s3: Any, s3_key: str) -> None:
+        super().__init__()
+        self._s3 = s3
+        self._key = s3_key
+        self._upload_id = s3.create_multipart_upload(Bucket=S3_BUCKET, Key=s3_key)['UploadId']
+        self._buffer = bytearray()
+        self._part_number = 0
+        self._futures: List[concurrent.futures.Future] = []
+        self._slots = threading.BoundedSemaphore(S3_UPLOAD_MAX_INFLIGHT)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=S3_UPLOAD_MAX_INFLIGHT)
+    
+    def writable(self) -> bool:
+        return True
+    
+    def write(self, data: Any) -> int:
+        self._buffer += data
+        while len(self._buffer) >= S3_MULTIPART_CHUNKSIZE:
+            self._submit_part(bytes(self._buffer[:S3_MULTIPART_CHUNKSIZE]))
+            del self._buffer[:S3_MULTIPART_CHUNKSIZE]
+        return memoryview(data).nbytes
+    
+    def _upload_part(self, part_number: int, body: bytes) -> Dict[str, Any]:
+        response = self._s3.upload_part(Bucket=S3_BUCKET, Key=self._key, UploadId=self._upload_id,
+                                        PartNumber=part_number, Body=body)
+        return {'PartNumber': part_number, 'ETag': response['ETag']}
+    
+    def _submit_part(self, body: bytes) -> None:
+        # Fail fast instead of zipping the rest of the part for nothing
+        for future in self._futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+        self._slots.acquire()  # Backpressure: block while too many parts are in flight
+        self._part_number += 1
+        future = self._executor.submit(self._upload_part, self._part_number, body)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+    
+    def complete(self) -> None:
+        """Upload the tail part, wait for all parts and complete the upload."""
+        if self._buffer or self._part_number == 0:
+            self._submit_part(bytes(self._buffer))
+            self._buffer.clear()
+        parts = [future.result() for future in self._futures]
+        self._executor.shutdown(wait=True)
+        self._s3.complete_multipart_upload(Bucket=S3_BUCKET, Key=self._key, UploadId=self._upload_id,
+                                           MultipartUpload={'Parts': parts})
+    
+    def abort(self) -> None:
+        """Drop queued parts and abort the upload (orphans are also swept by cleanup_multipart_uploads)."""
+        for future in self._futures:
+            future.cancel()
+        self._executor.shutdown(wait=True)
+        try:
+            self._s3.abort_multipart_upload(Bucket=S3_BUCKET, Key=self._key, UploadId=self._upload_id)
+        except Exception as e:
+            logger.warning(f"Could not abort multipart upload for {self._key}: {e}")
+
+
+def stream_zip_to_s3(s3: Any, source_dir: str, members: List[str], s3_key: str) -> None:
+    """
+    V9: Zip members of source_dir (stored, no compression) and stream the archive straight
+    into a multipart upload, overlapping archive creation with the network
+    transfer. Raises on zip or upload failure; a failed attempt can simply be
+    retried since the source files are still on disk.
+    """
+    writer = _MultipartUploadWriter(s3, s3_key)
+    try:
+        write_zip_stored(source_dir, members, writer)
+        writer.complete()
+    except BaseException:
+        # Nothing becomes visible until complete() - a failed attempt leaves no object
+        writer.abort()
+        raise
+
+
+# ============ LARGE FILE DIRECT TRANSFER ============
+
+def _transfer_large_file(folder_name: str, lf: Dict[str, Any], label: str, status_queue: Any) -> bool:
+    """Copy one large file from SOURCE to DESTINATION with rclone copyto. Returns True on success."""
+    file_path = lf['path']
+    size_gb = lf.get('size_gb', '?')
+    
+    status_queue.put((label, "DIRECT COPY", f"{file_path} ({size_gb} GB)"))
+    
+    src = f"{SOURCE}/{folder_name}/{file_path}"
+    dst = f"{DESTINATION}/{folder_name}/{file_path}"
+    
+    # V9: JSON log + periodic stats on stderr (instead of --quiet) drive the status updates
+    cmd = [
+        'rclone', 'copyto', src, dst,
+        '--ignore-errors',
+        *RCLONE_LOG_ARGS,
+        *RCLONE_TUNING_ARGS
+    ]
+    
+    if os.path.exists(RCLONE_CONFIG):
+        cmd.extend(['--config', RCLONE_CONFIG])
+    
+    proc = None
+    try:
+        proc = subprocess.Popen(cmd, stderr=subprocess.PIPE, stdout=subprocess.DEVNULL)
+        rclone_log = new_rclone_log_state()
+        log_selector = selectors.DefaultSelector()
+        log_selector.register(proc.stderr, selectors.EVENT_READ)
+        try:
+            # V9: Wake on each stats record (or EOF at exit) instead of ticking every 5s
+            while True:
+                if _shutdown_requested.is_set():
+                    proc.terminate()
+                    try:
+                        proc.wait(timeout=5)
+                    except subprocess.TimeoutExpired:
+                        proc.kill()
+                    break
+                if log_selector.select(timeout=DOWNLOAD_POLL_INTERVAL):
+                    if not pump_rclone_log(proc.stderr, rclone_log):
+                        break
+                    if rclone_log["has_stats"]:
+                        put_status(status_queue, label, "TRANSFERRING",
+                                   f"{file_path} ({rclone_log['bytes'] // MB_IN_BYTES} MB / {size_gb} GB)")
+                elif proc.poll() is not None:
+                    break
+        finally:
+            log_selector.close()
+        proc.wait()
+        
+        if proc.returncode == 0:
+            if mark_large_file_complete(folder_name, file_path):
+                status_queue.put((label, "COMPLETED", f"* {file_path}"))
+                return True
+            status_queue.put((label, "WARN", f"{file_path}: progress save failed"))
+            return False
+        
+        err = rclone_log["errors"][-1].strip() if rclone_log["errors"] else ""
+        status_queue.put((label, "ERROR", f"{file_path}: {err[:30] if err else 'Unknown error'}"))
+        return False
+    except Exception as e:
+        status_queue.put((label, "ERROR", f"{file_path}: {str(e)[:30]}"))
+        return False
+    finally:
+        if proc:
+            try:
+                proc.stderr.close()
+            except Exception:
+                pass
+
+
+def transfer_large_files(folder_name: str, status_queue: Any, lock: Any) -> List[str]:
+    """Transfer large files directly from SOURCE to DESTINATION via rclone."""
+    global _progress_lock
+    _progress_lock = lock
+    
+    if shutil.which("rclone") is None:
+        status_queue.put((f"*{folder_name}", "ERROR", "Rclone not installed"))
+        return []
+    
+    large_files = fetch_large_files(folder_name)
+    if not large_files:
+        return []
+    
+    done = get_completed_large_files(folder_name)
+    remaining: List[Dict[str, Any]] = []
+    
+    for lf in large_files:
+        if not isinstance(lf, dict):
+            logger.warning(f"Skipping invalid large file entry: {lf}")
+            continue
+        if 'path' not in lf:
+            logger.warning(f"Skipping large file entry missing 'path': {lf}")
+            continue
+        if lf['path'] not in done:
+            remaining.append(lf)
+    
+    if not remaining:
+        status_queue.put((f"*{folder_name}", "SKIPPED", "All large files done"))
+        return []
+    
+    status_queue.put((f"*{folder_name}", "LARGE FILES", f"{len(remaining)} file(s)"))
+    
+    def _copy(indexed: Tuple[int, Dict[str, Any]]) -> Optional[str]:
+        i, lf = indexed
+        if _shutdown_requested.is_set():
+            return None
+        label = f"*{folder_name}[{i+1}/{len(remaining)}]"
+        return None if _transfer_large_file(folder_name, lf, label, status_queue) else lf['path']
+    
+    # V9: Several direct copies at once instead of one after another (each
+    # copyto additionally splits its file into RCLONE_MULTI_THREAD_STREAMS)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, LARGE_FILE_CONCURRENCY)) as tp:
+        failed_large = [path for path in tp.map(_copy, enumerate(remaining)) if path is not None]
+    
+    if _shutdown_requested.is_set():
+        status_queue.put((f"*{folder_name}", "ABORTED", "Shutdown requested"))
+    
+    return failed_large
+
+
+# ============ NORMAL ZIP PIPELINE ============
+
+def _init_pipeline_worker(status_queue: Any, lock: Any) -> None:
+    """V9: ProcessPoolExecutor initializer - install IPC handles and warm the S3 client once."""
+    global _status_queue, _progress_lock
+    global _progress_pending, _progress_pending_count, _progress_pending_lock, _progress_flush_timer
+    global _progress_inflight, _progress_cache_lock
+    _status_queue = status_queue
+    _progress_lock = lock
+    # V9: Forked children inherit the parent's queued updates and timer state - start clean
+    _progress_pending = {}
+    _progress_pending_count = 0
+    _progress_inflight = 0
+    _progress_pending_lock = threading.RLock()
+    _progress_flush_timer = None
+    _progress_cache_lock = threading.Lock()  # May have been held by a parent thread at fork
+    # V9: Pool workers leave via os._exit (atexit never runs) - flush queued
+    # progress from multiprocessing's own exit finalizers instead
+    Finalize(None, flush_all_progress, exitpriority=10)
+    Finalize(None, wait_background_cleanup, exitpriority=10)
+    try:
+        get_s3_client()
+    except Exception as e:
+        # pipeline_worker retries client creation and reports the error per part
+        logger.warning(f"Worker S3 client warm-up failed: {e}")
+
+
+def run_pipeline_task(task_data: Tuple) -> bool:
+    """
+    V9: Pool entry point - runs pipeline_worker, then writes the task's queued
+    progress. The pool outlives each folder, so worker exit can no longer be
+    relied on to flush before main() marks the folder complete. Parts are only
+    reported "Saved to S3" once that write has succeeded.
+    """
+    uploaded_rows: List[str] = []
+    try:
+        return pipeline_worker(task_data, uploaded_rows)
+    finally:
+        folder_name = task_data[4]
+        saved = flush_progress(folder_name)
+        status_queue = FolderStatusQueue(_status_queue, folder_name)
+        for row in uploaded_rows:
+            if saved:
+                status_queue.put((row, "COMPLETED", "Saved to S3 *"))
+            else:
+                status_queue.put((row, "WARN", "Upload OK, progress save failed"))
+
+
+def pipeline_worker(task_data: Tuple, uploaded_rows: List[str]) -> bool:
+    """
+    The Core Logic for normal files.
+    V9: Rows of parts uploaded with their progress still queued are appended to
+    uploaded_rows; run_pipeline_task reports them once the flush has run.
+    """
+    (file_batch, folder_path, base_s3_key, part_name, folder_name) = task_data
+    # V9: The batch arrives as one newline-joined string (see run_zip_pipeline)
+    original_file_list = file_batch.split("\n")
+    status_queue = FolderStatusQueue(_status_queue, folder_name)
+    
+    if shutil.which("rclone") is None:
+        status_queue.put((part_name, "ERROR", "Rclone Missing"))
+        return False
+    s3 = get_s3_client()
+    
+    # V9: One (conditional) progress read per task - the split checks below use
+    # this snapshot instead of a load_progress() round-trip per split. The flush
+    # timer mutates the cached dict in place while holding _progress_lock, so the
+    # read and the set() copy happen under that same lock.
+    # main() already ran filter_completed() before batching and each file lands in
+    # exactly one batch, so the batch is not re-filtered against completed_files here.
+    with (_progress_lock if _progress_lock is not None else contextlib.nullcontext()):
+        progress = load_progress(folder_name)
+        completed_keys = set(progress.get("completed_keys", ()))
+    
+    remaining_files = original_file_list[:]
+    split_index = 0
+    # V9: Split keys are "<base>_Split<n>.<ext>"; rpartition keeps dots elsewhere in the key intact
+    key_base, _, key_ext = base_s3_key.rpartition('.')
+    
+    while len(remaining_files) > 0:
+        if _shutdown_requested.is_set():
+            status_queue.put((part_name, "ABORTED", "Shutdown requested"))
+            return False
+        
+        # V9: Downloads may go to a faster scratch filesystem - pressure is measured there
+        download_root = get_download_root()
+        
+        # V6 FIX: Apply backpressure if disk is getting full
+        if apply_backpressure(download_root):
+            status_queue.put((part_name, "BACKPRESSURE", "Throttling downloads..."))
+            wait_background_cleanup()  # V9: Let pending deletions free their space first
+            time.sleep(5)
+        
+        if split_index == 0:
+            current_s3_key = base_s3_key
+            current_status_name = part_name
+        else:
+            current_s3_key = f"{key_base}_Split{split_index}.{key_ext}"
+            current_status_name = f"{part_name}.{split_index}"
+        
+        if current_s3_key in completed_keys:
+            status_queue.put((current_status_name, "SKIPPED", "Split done (JSON)"))
+            split_index += 1
+            continue
+        
+        # V9: mkdtemp picks a fresh name atomically (no randint collisions between workers)
+        try:
+            temp_dir = tempfile.mkdtemp(prefix=f"{TEMP_DIR_PREFIX}{part_name}_{split_index}_",
+                                        dir=download_root)
+        except OSError as e:
+            status_queue.put((current_status_name, "ERROR", f"Temp dir: {str(e)[:30]}"))
+            return False
+        zip_filename = current_s3_key.split('/')[-1]
+        local_zip = os.path.join(WORK_DIR, zip_filename)
+        proc = None
+        disk_triggered = False
+        size_triggered = False
+        
+        try:
+            list_path = os.path.join(temp_dir, "filelist.txt")
+            with open(list_path, 'w', encoding=UTF8_ENCODING) as f:
+                # V9: One write of the joined list instead of a write() per file
+                f.write("\n".join(map(safe_encode_filename, remaining_files)) + "\n")
+            
+            status_queue.put((current_status_name, "DOWNLOADING", f"Target: {len(remaining_files)} files"))
+            
+            # V9: Small batches look each file up individually (--no-traverse);
+            # big ones are cheaper as a recursive listing matched locally, but only
+            # on remotes with ListR - elsewhere --fast-list is a full folder walk
+            use_fast_list = (len(remaining_files) >= FAST_LIST_MIN_FILES
+                             and remote_supports_list_r(SOURCE.split(':', 1)[0] + ':'))
+            traverse_flag = '--fast-list' if use_fast_list else '--no-traverse'
+            
+            # V9: JSON log + periodic stats on stderr replace the temp dir walk
+            cmd_dl = ['rclone', 'copy', folder_path, temp_dir, '--files-from', list_path,
+                      f'--transfers={DOWNLOAD_THREADS}',
+                      '--ignore-errors', traverse_flag,
+                      *RCLONE_LOG_ARGS,
+                      *RCLONE_TUNING_ARGS]
+            
+            if os.path.exists(RCLONE_CONFIG):
+                cmd_dl.extend(['--config', RCLONE_CONFIG])
+            
+            proc = subprocess.Popen(cmd_dl, stderr=subprocess.PIPE)
+            rclone_log = new_rclone_log_state()
+            # V9: Event loop on rclone's stderr instead of a reader thread + fixed
+            # sleep - wakes on every stats record and sees exit at once (EOF)
+            log_selector = selectors.DefaultSelector()
+            log_selector.register(proc.stderr, selectors.EVENT_READ)
+            # V9: Fallback size walk state - last walked size/time and an EWMA of the download rate
+            walk_size = 0
+            walk_ts = 0.0
+            next_walk_ts = 0.0
+            rate_ewma = 0.0
+            
+            while True:
+                if _shutdown_requested.is_set():
+                    proc.terminate()
+                    try:
+                        proc.wait(timeout=5)
+                    except subprocess.TimeoutExpired:
+                        proc.kill()
+                    log_selector.close()
+                    status_queue.put((current_status_name, "ABORTED", "Shutdown requested"))
+                    return False
+                
+                if log_selector.select(timeout=DOWNLOAD_POLL_INTERVAL):
+                    if not pump_rclone_log(proc.stderr, rclone_log):
+                        proc.wait()
+                        break
+                elif proc.poll() is not None:
+                    break
+                
+                # V9: rclone reports transferred bytes itself; only walk the temp
+                # dir if no stats line has arrived yet (e.g. very old rclone)
+                if rclone_log["has_stats"]:
+                    size_bytes = rclone_log["bytes"]
+                else:
+                    # V9: The loop wakes on every log line - re-walk only when due.
+                    # Walks are spaced up to SIZE_WALK_MAX_INTERVAL apart, sooner
+                    # only if the recent rate could reach the size cap before then.
+                    now = time.monotonic()
+                    if now >= next_walk_ts:
+                        walked = get_folder_size_bytes(temp_dir)
+                        if walk_ts:
+                            rate = max(0, walked - walk_size) / max(now - walk_ts, 1e-3)
+                            rate_ewma = 0.7 * rate_ewma + 0.3 * rate
+                        walk_size, walk_ts = walked, now
+                        seconds_to_cap = (MAX_ZIP_SIZE_BYTES - walked) / max(rate_ewma, MB_IN_BYTES)
+                        next_walk_ts = now + min(SIZE_WALK_MAX_INTERVAL,
+                                                 max(DOWNLOAD_POLL_INTERVAL, seconds_to_cap))
+                    size_bytes = walk_size
+                size_mb = size_bytes // MB_IN_BYTES
+                
+                if check_disk_usage(download_root):
+                    status_queue.put((current_status_name, "DISK FULL", "Halting & Splitting"))
+                    proc.kill()
+                    disk_triggered = True
+                    break
+                
+                if size_bytes > MAX_ZIP_SIZE_BYTES:
+                    status_queue.put((current_status_name, "SIZE CAP", f"{MAX_ZIP_SIZE_GB}GB limit hit"))
+                    proc.kill()
+                    size_triggered = True
+                    break
+                
+                put_status(status_queue, current_status_name, "DOWNLOADING", f"{size_mb} MB / {MAX_ZIP_SIZE_GB*1024} MB max")
+            log_selector.close()
+            
+            # V9: Read the log to EOF (rclone has exited or was killed) so every
+            # "Copied" record is seen, instead of sleeping and hoping it settled
+            while pump_rclone_log(proc.stderr, rclone_log):
+                pass
+            proc.wait()
+            
+            if rclone_log["has_stats"]:
+                # V9: rclone's own per-file log is the inventory - no directory walk,
+                # files cut off by a kill are excluded, and empty files count too
+                on_disk = {normalize_path(f) for f in rclone_log["copied"]}
+                downloaded_bytes = rclone_log["bytes"]
+            else:
+                # JSON log unusable (e.g. very old rclone) - inventory from disk
+                scanned, downloaded_bytes = scan_downloaded_files(temp_dir)
+                on_disk = set(scanned)
+            # V9: The zip is built from this same inventory (by on-disk path, i.e. the
+            # name written to the --files-from list), so the archive and the progress
+            # record always list the same files
+            downloaded_files: List[str] = []
+            zip_members: List[str] = []
+            for f in remaining_files:
+                member = normalize_path(safe_encode_filename(f))
+                if member in on_disk:
+                    downloaded_files.append(f)
+                    zip_members.append(member)
+            remaining_files = filter_completed(remaining_files, set(downloaded_files))
+            
+            if downloaded_files:
+                status_queue.put((current_status_name, "ZIPPING", f"{len(downloaded_files)} files"))
+                
+                # V9: EAFP - one unlink syscall instead of stat + unlink
+                try:
+                    os.unlink(list_path)
+                except FileNotFoundError:
+                    pass
+                
+                if ZIP_STREAM_UPLOAD:
+                    # V9: Archive is piped straight into S3 - no local zip, no disk needed for it
+                    status_queue.put((current_status_name, "UPLOADING", f"Streaming {len(downloaded_files)} files"))
+                    
+                    def _upload() -> None:
+                        stream_zip_to_s3(s3, temp_dir, zip_members, current_s3_key)
+                else:
+                    # Stored zip ~= bytes transferred (headers are noise at this scale)
+                    estimated_zip_size = downloaded_bytes
+                    if not check_disk_space_for_file(estimated_zip_size):
+                        status_queue.put((current_status_name, "ERROR", "Insufficient disk for zip"))
+                        return False
+                    
+                    # V9: zipfile in-process instead of forking the zip CLI
+                    with open(local_zip, 'wb') as zip_out:
+                        write_zip_stored(temp_dir, zip_members, zip_out)
+                    
+                    # V6 FIX: Verify zip integrity before upload
+                    if not verify_zip_integrity(local_zip):
+                        status_queue.put((current_status_name, "ERROR", "Zip integrity check failed"))
+                        return False
+                    
+                    file_size = os.path.getsize(local_zip)
+                    status_queue.put((current_status_name, "UPLOADING", f"{int(file_size/(1024*1024))} MB"))
+                    
+                    def _upload() -> None:
+                        s3.upload_file(local_zip, S3_BUCKET, current_s3_key, Config=S3_TRANSFER_CONFIG)
+                        drop_page_cache(local_zip)  # V9: Uploaded - don't keep GBs of it cached
+                
+                try:
+                    # V9: No HEAD afterwards - upload_file / complete_multipart_upload only
+                    # return once S3 has committed the object, and raise otherwise
+                    s3_operation_with_retry(_upload)
+                    
+                    if mark_part_complete(folder_name, current_s3_key, downloaded_files):
+                        # V9: Only queued so far - "Saved to S3" once the task's flush succeeds
+                        status_queue.put((current_status_name, "UPLOADED", "Saving progress..."))
+                        uploaded_rows.append(current_status_name)
+                    else:
+                        status_queue.put((current_status_name, "WARN", "Upload OK, progress save failed"))
+                except Exception as e:
+                    status_queue.put((current_status_name, "ERROR", f"Upload failed: {str(e)[:30]}"))
+                    return False
+            else:
+                if not disk_triggered and not size_triggered and proc.returncode != 0:
+                    err_msg = "Rclone Failed"
+                    if rclone_log["errors"]:
+                        err_msg = f"Rclone: {rclone_log['errors'][-1].strip()[:40]}"
+                    status_queue.put((current_status_name, "ERROR", err_msg))
+                    return False
+            
+        except Exception as e:
+            status_queue.put((current_status_name, "ERROR", str(e)[:40]))
+            return False
+        
+        finally:
+            if proc and proc.poll() is None:
+                try:
+                    proc.kill()
+                except Exception:
+                    pass
+            
+            if proc:
+                try:
+                    if proc.stdout:
+                        proc.stdout.close()
+                    if proc.stderr:
+                        proc.stderr.close()
+                except Exception:
+                    pass
+            
+            # V9: Rename + background delete - the next split's download starts immediately
+            # (discard_path is a no-op for paths that don't exist)
+            discard_path(local_zip)
+            discard_path(temp_dir)
+        
+        if len(remaining_files) > 0:
+            split_index += 1
+            trigger = "size cap" if size_triggered else "disk"
+            status_queue.put((part_name, "SPLITTING", f"{len(remaining_files)} remain ({trigger})"))
+        else:
+            break
+    
+    return True
+
+
+# ============ MONITOR ============
+
+# V9: Continuous progress states that may be coalesced; terminal states never are
+_THROTTLED_STATES = ("DOWNLOADING", "TRANSFERRING")
+_last_status_put: Dict[str, float] = {}
+
+_NATURAL_SORT_RE = re.compile(r'(\d+)')
+
+# V9: Monitor row colors - ANSI templates built once instead of per row per frame
+_ANSI_RED = "\033[91m{}\033[0m"
+_ANSI_GREEN = "\033[92m{}\033[0m"
+_ANSI_YELLOW = "\033[93m{}\033[0m"
+_ANSI_MAGENTA = "\033[95m{}\033[0m"
+_ANSI_CYAN = "\033[96m{}\033[0m"
+_ROW_TEMPLATE_BY_STATE = {
+    "ERROR": _ANSI_RED, "ABORTED": _ANSI_RED,
+    "COMPLETED": _ANSI_GREEN, "SKIPPED": _ANSI_GREEN,
+    "RESUMED": _ANSI_CYAN,
+    "DIRECT COPY": _ANSI_MAGENTA, "TRANSFERRING": _ANSI_MAGENTA,
+}
+_ROW_WARN_MARKERS = ("DISK FULL", "SIZE CAP", "BACKPRESSURE")
+
+
+def _row_template(state: str) -> str:
+    """ANSI format template for a monitor row in the given state ("{}" = uncolored)."""
+    template = _ROW_TEMPLATE_BY_STATE.get(state)
+    if template is not None:
+        return template
+    if any(marker in state for marker in _ROW_WARN_MARKERS):
+        return _ANSI_YELLOW
+    return "{}"
+
+
+def natural_sort_key(s: str) -> List[Any]:
+    """Sort key that orders Part2 before Part10."""
+    return [int(t) if t.isdigit() else t.lower() for t in _NATURAL_SORT_RE.split(s)]
+
+
+class FolderStatusQueue:
+    """
+    V9: Status queue view for one folder. The run-wide queue outlives each folder,
+    and a worker's last updates can arrive after that folder's monitor has
+    stopped, so every (part, state, info) tuple is tagged with its folder and
+    monitor() drops tuples belonging to other folders.
+    """
+    
+    def __init__(self, queue: Any, folder_name: str) -> None:
+        self._queue = queue
+        self._folder_name = folder_name
+    
+    def put(self, item: Tuple[Any, str, str]) -> None:
+        self._queue.put((self._folder_name, *item))
+
+
+def put_status(status_queue: Any, part: str, state: str, info: str) -> None:
+    """Send a status update, dropping progress updates faster than STATUS_MIN_INTERVAL."""
+    if state in _THROTTLED_STATES:
+        now = time.monotonic()
+        if now - _last_status_put.get(part, 0.0) < STATUS_MIN_INTERVAL:
+            return
+        _last_status_put[part] = now
+    status_queue.put((part, state, info))
+
+
+def monitor(queue: Any, num_parts: int, folder_name: str) -> None:
+    """Live status monitor for one folder (reads folder-tagged tuples, see FolderStatusQueue)."""
+    statuses: Dict[str, Tuple[str, str]] = {}
+    # V9: Display order maintained on insert (parts are added rarely, redrawn often)
+    sorted_keys: List[str] = []
+    sort_keys: List[List[Any]] = []
+    
+    has_color = sys.stdout.isatty()
+    
+    def render_row(p: str) -> str:
+        state, info = statuses[p]
+        row = f"{p:<20} | {state:<15} | {info:<30}"
+        return _row_template(state).format(row) if has_color else row
+    
+    print("\n" * (MAX_PARALLEL_WORKERS + 5))
+    
+    # V9: Only repaint when a row actually changed since the last frame
+    dirty = True
+    last_draw = 0.0
+    # V9: What is currently on screen per row, and the table's height in lines
+    rendered: Dict[str, Tuple[str, str]] = {}
+    drawn_height = 0
+    
+    while not _shutdown_requested.is_set():
+        # V9: Block until an update arrives (redrawn right away, not on the next
+        # 1s tick), then take everything already queued without waiting. The
+        # timeout only bounds shutdown checks, or the rest of the redraw throttle.
+        if dirty:
+            timeout = max(0.0, last_draw + MONITOR_REDRAW_INTERVAL - time.monotonic())
+        else:
+            timeout = 1.0
+        updates: List[Tuple[str, Any, str, str]] = []
+        try:
+            updates.append(queue.get(timeout=timeout))
+            while True:
+                updates.append(queue.get_nowait())
+        except Empty:
+            pass
+        except Exception:
+            pass
+        
+        for update_folder, part, state, info in updates:
+            if update_folder != folder_name:
+                continue  # Late update from an earlier folder sharing part names
+            if part is None:
+                return
+            if statuses.get(part) != (state, info):
+                if part not in statuses:
+                    key = natural_sort_key(part)
+                    idx = bisect.bisect(sort_keys, key)
+                    sort_keys.insert(idx, key)
+                    sorted_keys.insert(idx, part)
+                statuses[part] = (state, info)
+                dirty = True
+        
+        if not dirty or time.monotonic() - last_draw < MONITOR_REDRAW_INTERVAL:
+            continue
+        dirty = False
+        last_draw = time.monotonic()
+        
+        if not has_color:
+            # V9: Plain output (pipes/logs) - header once, then only rows that changed
+            if not drawn_height:
+                print(f"{'PART':<20} | {'STATUS':<15} | {'INFO':<30}")
+                print("-" * 70)
+                drawn_height = 2
+            for p in sorted_keys:
+                if rendered.get(p) != statuses[p]:
+                    rendered[p] = statuses[p]
+                    print(render_row(p))
+        elif len(rendered) != len(sorted_keys):
+            # New row - positions below it shift, so repaint the whole table in place
+            if drawn_height:
+                sys.stdout.write(f"\033[{drawn_height}A")
+            print(f"{'PART':<20} | {'STATUS':<15} | {'INFO':<30}\033[K")
+            print("-" * 70 + "\033[K")
+            for p in sorted_keys:
+                print(render_row(p) + "\033[K")
+            rendered = dict(statuses)
+            drawn_height = len(sorted_keys) + 2
+        else:
+            # V9: Rewrite just the changed rows; the cursor rests below the table
+            row_count = len(sorted_keys)
+            for idx, p in enumerate(sorted_keys):
+                if rendered[p] != statuses[p]:
+                    rendered[p] = statuses[p]
+                    up = row_count - idx
+                    sys.stdout.write(f"\033[{up}A\r{render_row(p)}\033[K\033[{up}B\r")
+        
+        sys.stdout.flush()
+
+
+# ============ CLEANUP MULTIPART UPLOADS ============
+
+def cleanup_multipart_uploads() -> int:
+    """Abort incomplete multipart uploads."""
+    try:
+        s3 = get_s3_client()
+        paginator = s3.get_paginator('list_multipart_uploads')
+        
+        def _abort(upload: Dict[str, Any]) -> bool:
+            try:
+                s3.abort_multipart_upload(
+                    Bucket=S3_BUCKET,
+                    Key=upload['Key'],
+                    UploadId=upload['UploadId']
+                )
+                return True
+            except Exception:
+                return False
+        
+        # V9: Abort concurrently (the client is thread-safe; SlowDown is absorbed
+        # by the adaptive retry mode) instead of one round-trip at a time
+        cleaned = 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=MULTIPART_ABORT_THREADS) as exe:
+            for page in paginator.paginate(Bucket=S3_BUCKET, Prefix=S3_PREFIX):
+                cleaned += sum(exe.map(_abort, page.get('Uploads', [])))
+        return cleaned
+    except Exception as e:
+        logger.warning(f"Could not cleanup multipart uploads: {e}")
+        return 0
+
+
+# ============ SIGNAL HANDLERS ============
+
+def signal_handler(signum: int, frame: Any) -> None:
+    """Handle shutdown signals gracefully."""
+    logger.warning(f"Received signal {signum}, shutting down gracefully...")
+    _shutdown_requested.set()
+    # V9: Queued progress is flushed by main()'s finally / atexit, not here -
+    # the interrupted frame may be holding the progress lock
+    # V7 FIX: Release lock on signal
+    release_instance_lock()
+
+
+# ============ MAIN ============
+
+def load_folder_metadata(folder_name: str, progress_keys: Optional[Set[str]]) -> Tuple[Dict[str, Any], List[str], List[Dict[str, Any]]]:
+    """
+    V9: Progress, file map and large-file list for one folder. The map and the
+    large-file list are fetched concurrently; neither is fetched for a folder
+    that is already complete.
+    """
+    # Read the folder's progress once; folders absent from the LIST have none.
+    # Not cached - most prefetched folders are complete and never read again here
+    if progress_keys is not None and get_progress_key(folder_name) not in progress_keys:
+        progress: Dict[str, Any] = {}
+    else:
+        progress = load_progress(folder_name, cache=False)
+    
+    if progress.get("folder_complete", False):
+        return progress, [], []
+    
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as exe:
+        large_future = exe.submit(fetch_large_files, folder_name)
+        files = fetch_map(folder_name)
+        return progress, files, large_future.result()
+
+
+def ensure_rclone() -> bool:
+    """V9: Install rclone if it is missing; False if the install failed."""
+    if shutil.which("rclone") is not None:
+        return True
+    print("   * Installing Rclone...")
+    install_script = None
+    try:
+        # V9: Fetch the installer in-process instead of forking curl
+        with urllib.request.urlopen("https://rclone.org/install.sh", timeout=60) as response, \
+                tempfile.NamedTemporaryFile('wb', suffix='.sh', delete=False) as f:
+            shutil.copyfileobj(response, f)
+            install_script = f.name
+        subprocess.run(
+            ["sudo", "bash", install_script],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            timeout=120
+        )
+        return True
+    except Exception as e:
+        logger.error(f"Failed to install rclone: {e}")
+        return False
+    finally:
+        if install_script:
+            try:
+                os.remove(install_script)
+            except OSError:
+                pass
+
+
+def main() -> None:
+    global _progress_lock
+    print("* PYTHON MASTER WORKER (v9 - Ultimate Production Release)")
+    print("=" * 60)
+    print(f"   Source       : {SOURCE}")
+    print(f"   Destination  : {DESTINATION} (large files only)")
+    print(f"   S3 Bucket    : {S3_BUCKET}")
+    print(f"   Max Zip Size : {MAX_ZIP_SIZE_GB} GB")
+    print(f"   Work Dir     : {WORK_DIR}")
+    if FAST_TMPDIR:
+        print(f"   Scratch Dir  : {FAST_TMPDIR}")
+    print("=" * 60)
+    
+    # V7: Acquire instance lock (cross-platform)
+    if not acquire_instance_lock():
+        logger.error("Another instance is already running. Exiting.")
+        return
+    
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    
+    q: Optional[Any] = None
+    zip_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+    try:
+        if not AWS_ACCESS_KEY or not AWS_SECRET_KEY:
+            print("\nX AWS credentials not configured!")
+            print("   Set environment variables:")
+            print("   export AWS_ACCESS_KEY_ID='your_key'")
+            print("   export AWS_SECRET_ACCESS_KEY='your_secret'")
+            return
+        
+        print("\n* Checking dependencies...")
+        
+        # V9: Archives are built with zipfile in-process - no zip package needed.
+        # rclone installs in the background while S3 is checked and the folder
+        # list is fetched; it is only awaited before the first transfer.
+        install_exe = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        rclone_future = install_exe.submit(ensure_rclone)
+        install_exe.shutdown(wait=False)
+        
+        print("* Testing S3 connection...")
+        try:
+            s3 = get_s3_client()
+            s3.head_bucket(Bucket=S3_BUCKET)
+            print("   * S3 connection successful\n")
+        except Exception as e:
+            logger.error(f"S3 connection failed: {e}\n")
+            return
+        
+        # V9: Run startup cleanup in the background while the folder list is
+        # fetched. Both must finish before any worker starts: stale temp dirs
+        # share TEMP_DIR_PREFIX and aborts target every upload under S3_PREFIX.
+        print("* Cleaning up orphaned temp directories and incomplete uploads...")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as boot_exe:
+            temp_future = boot_exe.submit(cleanup_orphaned_temp_dirs)
+            uploads_future = boot_exe.submit(cleanup_multipart_uploads)
+            
+            print("* Fetching folder list from S3...")
+            SUBFOLDERS = fetch_folder_list()
+            
+            cleaned_temps = temp_future.result()
+            cleaned_uploads = uploads_future.result()
+        
+        if cleaned_temps > 0:
+            print(f"   Removed {cleaned_temps} orphaned temp directories")
+        if cleaned_uploads > 0:
+            print(f"   Cleaned up {cleaned_uploads} incomplete multipart upload(s)")
+        
+        if not SUBFOLDERS:
+            print("X No folders to process. Run mapper.py first!")
+            return
+        
+        if not rclone_future.result():
+            return
+        print("* Dependencies ready!\n")
+        
+        # V9: Recover updates a crashed run journaled but never flushed to S3
+        # (before the LIST below, since replay can create progress files)
+        replayed = replay_progress_journals()
+        if replayed > 0:
+            print(f"* Recovered unsaved progress for {replayed} folder(s) from local journals")
+        
+        # V9: One LIST tells us which folders have progress at all; folders
+        # without a progress file skip the GET entirely.
+        progress_keys = list_progress_keys()
+        
+        # V9: The next folder's metadata is fetched in the background while the
+        # current folder is processed (single-slot prefetch)
+        prefetch_exe = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        next_metadata = prefetch_exe.submit(load_folder_metadata, SUBFOLDERS[0], progress_keys)
+        
+        # V9: One status queue, progress lock and worker pool for the whole run.
+        # Plain pipe-backed queue/lock instead of a Manager proxy process; they
+        # cannot be pickled into task tuples, so pool workers receive them once
+        # through the initializer. Reusing the pool keeps the workers' S3
+        # connections and progress caches warm from one folder to the next.
+        q = multiprocessing.Queue()
+        lock = multiprocessing.Lock()
+        # V9: main()'s own mark_folder_complete / flush_progress must take the same
+        # lock as the workers, whose flush timers may still be writing this folder
+        _progress_lock = lock
+        
+        for folder_index, folder in enumerate(SUBFOLDERS):
+            if _shutdown_requested.is_set():
+                print("\n* Shutdown requested, stopping...")
+                break
+            
+            metadata = next_metadata
+            if folder_index + 1 < len(SUBFOLDERS):
+                next_metadata = prefetch_exe.submit(load_folder_metadata, SUBFOLDERS[folder_index + 1], progress_keys)
+            progress, files, large_files = metadata.result()
+            
+            if progress.get("folder_complete", False):
+                print(f"* Skipping {folder} (fully completed)")
+                continue
+            
+            print(f"* Processing: {folder}")
+            
+            has_normal = bool(files)
+            has_large = bool(large_files)
+            
+            if not has_normal and not has_large:
+                print("   * No files found on S3. Skipping.")
+                continue
+            
+            if has_normal:
+                # V9: Ordered dicts already give O(1) membership - no set copy
+                completed = progress.get("completed_files", {})
+                # V9: Only normalize/filter when there is something to filter out
+                if completed:
+                    original_count = len(files)
+                    files = filter_completed(files, completed)
+                    print(f"   * Normal: {original_count - len(files)} done, {len(files)} remaining")
+            
+            if has_large:
+                done_large = progress.get("large_files_done", {})
+                remaining_large = [lf for lf in large_files if lf['path'] not in done_large]
+                if done_large:
+                    print(f"   * Large: {len(done_large)} done, {len(remaining_large)} remaining")
+            else:
+                remaining_large = []
+            
+            if not files and not remaining_large:
+                print(f"   * All files completed!")
+                mark_folder_complete(folder)
+                continue
+            
+            folder_q = FolderStatusQueue(q, folder)
+            total_parts = (len(files) + SPLIT_THRESHOLD - 1) // SPLIT_THRESHOLD
+            monitor_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            try:
+                monitor_future = monitor_executor.submit(monitor, q, total_parts + (1 if remaining_large else 0), folder)
+                
+                has_failures = False
+                with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_PARALLEL_WORKERS + 1) as thread_exe:
+                    futures = []
+                    large_future = None
+                    
+                    if remaining_large:
+                        print(f"   * {len(remaining_large)} large file(s) -> direct transfer to {DESTINATION}")
+                        large_future = thread_exe.submit(transfer_large_files, folder, folder_q, lock)
+                        futures.append(large_future)
+                    
+                    zip_future = None
+                    if files:
+                        if zip_pool is None:
+                            zip_pool = concurrent.futures.ProcessPoolExecutor(
+                                max_workers=MAX_PARALLEL_WORKERS,
+                                initializer=_init_pipeline_worker,
+                                initargs=(q, lock))
+                        num_parts = total_parts
+                        print(f"   * {len(files)} normal files -> {num_parts} part(s)")
+                        
+                        # Bind loop variables by reference at def-time (no list copy needed)
+                        def run_zip_pipeline(files_list: List[str] = files,
+                                             folder_name: str = folder,
+                                             exe: concurrent.futures.ProcessPoolExecutor = zip_pool) -> bool:
+                            tasks = []
+                            # V9: Single pass over the file list instead of re-slicing per part
+                            files_iter = iter(files_list)
+                            # V9: Per-folder constants, computed once rather than per part
+                            source_path = f"{SOURCE}/{folder_name}"
+                            safe_folder = sanitize_name(folder_name)
+                            for i in range(num_parts):
+                                # V9: One str per task pickles as a single buffer, not 1000 objects
+                                # (paths come from newline-delimited lists, so never contain '\n')
+                                batch = "\n".join(itertools.islice(files_iter, SPLIT_THRESHOLD))
+                                part = f"Part{i+1}" if num_parts > 1 else "Full"
+                                s3_key = f"{S3_PREFIX}{safe_folder}_{part}.zip"
+                                tasks.append((batch, source_path, s3_key, part, folder_name))
+                            
+                            results = list(exe.map(run_pipeline_task, tasks))
+                            return any(r is False for r in results)
+                        
+                        zip_future = thread_exe.submit(run_zip_pipeline)
+                        futures.append(zip_future)
+                    
+                    for f in futures:
+                        try:
+                            result = f.result()
+                            if result is True and f != large_future:
+                                has_failures = True
+                                print(f"   * Some zip pipeline worker(s) FAILED!")
+                        except Exception as e:
+                            has_failures = True
+                            print(f"   * Future failed: {e}")
+                    
+                    if large_future and large_future.done():
+                        try:
+                            failed_large_files = large_future.result()
+                            if failed_large_files:
+                                has_failures = True
+                                print(f"   * {len(failed_large_files)} large file(s) FAILED!")
+                        except Exception:
+                            has_failures = True
+                    
+                    # V9: A crashed worker breaks the whole pool - start a fresh one for the next folder
+                    if zip_future is not None and isinstance(zip_future.exception(), concurrent.futures.BrokenExecutor):
+                        zip_pool.shutdown(wait=True)
+                        zip_pool = None
+                
+                if has_failures:
+                    flush_progress(folder)  # V9: Save what did succeed now, not at the next checkpoint
+                    print(f"\n* {folder} -- INCOMPLETE (some transfers failed, will retry on next run)\n")
+                else:
+                    mark_folder_complete(folder)
+                    print(f"\n* {folder} -- ALL DONE\n")
+                
+                folder_q.put((None, "DONE", ""))
+            
+            finally:
+                monitor_executor.shutdown(wait=True)
+        
+        prefetch_exe.shutdown(wait=False)
+        print("\n* ALL FOLDERS COMPLETE!")
+    
+    finally:
+        # V9: Pool shutdown runs the workers' exit flushes before the final one below
+        if zip_pool is not None:
+            zip_pool.shutdown(wait=True)
+        if q is not None:
+            q.close()
+            q.join_thread()
+        flush_all_progress()  # V9: Write any debounced progress updates
+        # V7 FIX: Always release lock in finally block
+        release_instance_lock()
+
+
+if __name__ == "__main__":
+    main()
+